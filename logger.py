@@ -4,12 +4,14 @@ FreeSWITCH ESL Log Collector - Production Ready
 
 This is a corrected, production-ready version of the collector you provided.
 Key improvements:
-  - Robust file-opening with fallback directory and explicit utf-8 encoding
+  - Robust file-opening with fallback directory; lines are encoded to utf-8 once
+    and written by a background thread to unbuffered binary handles via writev()
   - Metrics for writes (bytes/logs)
   - Safe rotation and immediate re-opening after rotation
-  - Optional fsync-on-write controlled via SYNC_ON_WRITE env var
-  - Improved oldest-handle eviction by last-access time
-  - Proper signal handling that calls collector.shutdown()
+  - Optional grouped fdatasync once per flush interval via SYNC_ON_WRITE env var
+  - Least-recently-written handle eviction (OrderedDict LRU)
+  - Signal handling that only flags and wakes the main loop, which then calls
+    collector.shutdown() itself
   - Application log file handler (rotating file) optional via APP_LOG_FILE
   - Defensive event handling and more helpful debug logging
 
@@ -24,10 +26,14 @@ import sys
 import time
 import signal
 import logging
+import select
+import selectors
+import socket
 from datetime import datetime, timezone
 from pathlib import Path
-from collections import defaultdict, deque
-from threading import Lock, Thread
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock, Thread
 import re
 import json
 import errno
@@ -50,9 +56,22 @@ LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
 RECONNECT_DELAY = int(os.getenv('RECONNECT_DELAY', '5'))
 FILE_ROTATION_SIZE = int(os.getenv('FILE_ROTATION_SIZE', '104857600'))  # 100MB
 BUFFER_FLUSH_INTERVAL = int(os.getenv('BUFFER_FLUSH_INTERVAL', '5'))  # seconds
+# Floor for the writer's idle wait and the ESL select timeout; 0 would busy-spin both
+_IDLE_WAIT = max(BUFFER_FLUSH_INTERVAL, 0.1)
 MAX_FILE_DESCRIPTORS = int(os.getenv('MAX_FILE_DESCRIPTORS', '50'))
 SYNC_ON_WRITE = os.getenv('SYNC_ON_WRITE', 'false').lower() in ('1', 'true', 'yes')
+# Tell the kernel written log pages won't be re-read, so they don't push FreeSWITCH's cache out
+DROP_PAGE_CACHE = os.getenv('DROP_PAGE_CACHE', 'true').lower() in ('1', 'true', 'yes')
 APP_LOG_FILE = os.getenv('APP_LOG_FILE', '')  # e.g. /var/log/freeswitch/collector.log
+# Mirror every line into fs_cli.log as well; disabling halves disk writes
+ENABLE_FS_CLI_MIRROR = os.getenv('ENABLE_FS_CLI_MIRROR', 'true').lower() in ('1', 'true', 'yes')
+WRITE_QUEUE_SIZE = int(os.getenv('WRITE_QUEUE_SIZE', '100000'))  # max lines pending disk write
+WRITE_BATCH_SIZE = int(os.getenv('WRITE_BATCH_SIZE', '1024'))  # max lines per writer drain cycle
+RECV_BATCH_SIZE = int(os.getenv('RECV_BATCH_SIZE', '256'))  # max extra events drained per wakeup
+ESL_RCVBUF = int(os.getenv('ESL_RCVBUF', '0'))  # ESL socket SO_RCVBUF, 0 = kernel autotuning (recommended)
+# Space-separated event names to subscribe to, e.g. "LOG CHANNEL_CREATE CHANNEL_HANGUP_COMPLETE CUSTOM sofia::register"
+ESL_SUBSCRIBED_EVENTS = ' '.join(os.getenv('ESL_SUBSCRIBED_EVENTS', 'all').split()) or 'all'
+DOMAIN_CACHE_SIZE = int(os.getenv('DOMAIN_CACHE_SIZE', '4096'))  # distinct header values whose validation is remembered
 
 # Setup application logging (stdout + optional file rotating handler)
 root_logger = logging.getLogger()
@@ -74,11 +93,47 @@ if APP_LOG_FILE:
         root_logger.warning(f"Failed to create app log file {APP_LOG_FILE}: {e}")
 
 logger = logging.getLogger('freeswitch-logger')
+# The level is fixed at startup, so per-event debug lines check this flag instead
+# of building their f-strings only for logging to discard them
+_DEBUG = logger.isEnabledFor(logging.DEBUG)
+
+# Patterns used on every event, compiled once at import
+_UNSAFE_FILENAME_RE = re.compile(r'[<>:"/\\|?*\s]')
+_SIP_URI_DOMAIN_RE = re.compile(r'sip:[\w.+-]*@([\w.-]+)')
+# A bare hostname of any length, or dot-separated labels of 1-63 chars; [alnum - _] only
+_VALID_DOMAIN_RE = re.compile(r'[A-Za-z0-9_-]+|[A-Za-z0-9_-]{1,63}(?:\.[A-Za-z0-9_-]{1,63})+')
+
+# Headers consulted by extract_domain when variable_domain_name is missing, in priority order
+_DOMAIN_FALLBACK_HEADERS = (
+    'Caller-Domain', 'Callee-Domain', 'User-Domain', 'Domain',
+    'domain_name', 'variable_domain', 'variable_user_domain'
+)
+# Headers rendered as key=value on the rich line written for non-LOG events
+_RICH_EVENT_HEADERS = (
+    'Unique-ID', 'Channel-Name', 'Caller-ID-Number', 'Caller-ID-Name',
+    'Destination-Number', 'Caller-Domain', 'Callee-Domain', 'Channel-State',
+    'Call-Direction', 'Application', 'Application-Data',
+    'Presence-ID', 'Sofia-User-Agent', 'Signaling-IP', 'Signaling-Port',
+    'Media-IP', 'Media-Port', 'Session-ID'
+)
+# Core events that never carry channel variables or caller headers; extract_domain
+# could only ever answer 'unknown' for them, so its header fetches are skipped
+_DOMAINLESS_EVENTS = frozenset({
+    'API', 'BACKGROUND_JOB', 'RE_SCHEDULE', 'RELOADXML', 'MODULE_LOAD',
+    'MODULE_UNLOAD', 'STARTUP', 'SHUTDOWN',
+})
 
 
 class MetricsCollector:
     """Collects application metrics for monitoring"""
 
+    # Each hot counter has exactly one writing thread: events/drops come from the ESL
+    # (main) thread, writes from the log-writer thread. A single writer cannot lose an
+    # increment, so those skip the lock. The domain gauge is a plain store (from the
+    # writer's flush tick, and from close_all after the writer has exited), so it has
+    # no read-modify-write to lose either. Errors arrive from several threads and keep
+    # the lock. get_metrics() reads a best-effort snapshot without locking.
+
     def __init__(self):
         self.lock = Lock()
         self.events_processed = 0
@@ -86,37 +141,112 @@ class MetricsCollector:
         self.domains_count = 0
         self.bytes_written = 0
         self.errors_count = 0
+        self.dropped_count = 0
         self.last_event_time = time.time()
+        self._proc = psutil.Process()
+        self._rss_cache = (0.0, 0.0)  # (sampled at, RSS in MB)
 
     def record_event(self):
-        with self.lock:
-            self.events_processed += 1
-            self.last_event_time = time.time()
+        self.events_processed += 1
+        self.last_event_time = time.time()
 
-    def record_write(self, size):
-        with self.lock:
-            self.logs_written += 1
-            self.bytes_written += size
+    def record_write(self, size, count=1):
+        self.logs_written += count
+        self.bytes_written += size
 
     def record_domain(self, count):
-        with self.lock:
-            self.domains_count = count
+        self.domains_count = count
 
     def record_error(self):
         with self.lock:
             self.errors_count += 1
 
+    def record_drop(self):
+        self.dropped_count += 1
+
+    def _memory_mb(self):
+        # RSS reads /proc/self/statm; a few seconds of staleness is fine for metrics
+        now = time.time()
+        sampled_at, rss_mb = self._rss_cache
+        if now - sampled_at > 5.0:
+            rss_mb = self._proc.memory_info().rss / 1024 / 1024
+            self._rss_cache = (now, rss_mb)
+        return rss_mb
+
     def get_metrics(self):
-        with self.lock:
-            return {
-                'events_processed': self.events_processed,
-                'logs_written': self.logs_written,
-                'domains': self.domains_count,
-                'bytes_written': self.bytes_written,
-                'errors': self.errors_count,
-                'time_since_last_event': time.time() - self.last_event_time,
-                'memory_mb': psutil.Process().memory_info().rss / 1024 / 1024
-            }
+        memory_mb = self._memory_mb()
+        return {
+            'events_processed': self.events_processed,
+            'logs_written': self.logs_written,
+            'domains': self.domains_count,
+            'bytes_written': self.bytes_written,
+            'errors': self.errors_count,
+            'dropped': self.dropped_count,
+            'time_since_last_event': time.time() - self.last_event_time,
+            'memory_mb': memory_mb
+        }
+
+
+# Ring sentinel telling the writer thread to drain and exit
+_STOP = object()
+
+# Max iovecs per writev() call (1024 on Linux)
+try:
+    _IOV_MAX = os.sysconf('SC_IOV_MAX')
+except (AttributeError, ValueError, OSError):
+    _IOV_MAX = 1024
+if _IOV_MAX <= 0:
+    _IOV_MAX = 1024
+
+_fdatasync = getattr(os, 'fdatasync', os.fsync)  # fdatasync is missing on macOS
+# posix_fadvise is Linux/BSD only
+_FADV_DONTNEED = getattr(os, 'POSIX_FADV_DONTNEED', None) if hasattr(os, 'posix_fadvise') else None
+
+
+def _datasync(fd):
+    # Best-effort like the old per-write fsync: a failed barrier must not drop the batch
+    try:
+        _fdatasync(fd)
+    except OSError:
+        pass
+
+
+def _sync_and_close(handle):
+    _datasync(handle.fileno())
+    try:
+        handle.close()
+    except Exception:
+        pass
+
+
+class _EventHeaders(dict):
+    """Per-event header memo: each getHeader() crosses into libesl at most once per event"""
+    __slots__ = ('_event',)
+
+    def __init__(self, event):
+        super().__init__()
+        self._event = event
+
+    def __missing__(self, name):
+        try:
+            value = self._event.getHeader(name)
+        except Exception:
+            value = None
+        # the single typing point: consumers can rely on str or None
+        if value is not None and not isinstance(value, str):
+            value = str(value)
+        self[name] = value
+        return value
+
+
+class _DomainFile:
+    """One domain's open log file: the handle, its path and the bytes it holds"""
+    __slots__ = ('handle', 'path', 'size')
+
+    def __init__(self, handle, path, size):
+        self.handle = handle
+        self.path = path
+        self.size = size
 
 
 class LogManager:
@@ -136,14 +266,31 @@ class LogManager:
                 logger.error(f"Failed to create fallback log directory {fallback}: {e}")
                 raise
 
+        self._log_dir_str = str(self.log_dir)
+        # raw header value -> validated domain or '', LRU; only the ESL thread calls extract_domain, so no lock
+        self._domain_cache = OrderedDict()
+        self._safe_domains = {}  # raw domain -> sanitized filename stem
         self.rotation_size = rotation_size
-        self.file_handles = {}  # domain -> file object
-        self.file_sizes = defaultdict(int)
-        self.file_access = {}  # domain -> last access timestamp used to close oldest
-        self.buffers = defaultdict(list)
+        # domain -> _DomainFile, least recently written first; one lookup per write
+        self.files = OrderedDict()
+        # Hot path (ESL thread) only appends to the ring; the writer thread owns disk I/O.
+        # deque.append/popleft are atomic under the GIL, so the hot path takes no lock;
+        # maxlen makes a full ring discard its oldest line. The event only wakes an
+        # idle writer. The lock guards file handles shared between the writer and close.
+        self._ring = deque(maxlen=WRITE_QUEUE_SIZE)
+        self._wake = Event()
         self.lock = Lock()
         self.running = True
         self.metrics = metrics
+        self._ts_cache = (0, '')  # (epoch second, formatted 'YYYY-mm-dd HH:MM:SS')
+        self._write_errors = 0  # write failures since the last error summary
+        self._last_write_error_log = 0.0
+        # fdatasync releases the GIL, so a small pool syncs a batch's domains in parallel
+        self._sync_pool = (ThreadPoolExecutor(max_workers=min(8, MAX_FILE_DESCRIPTORS),
+                                              thread_name_prefix='log-sync')
+                           if SYNC_ON_WRITE else None)
+        self._writer = Thread(target=self._writer_loop, name='log-writer', daemon=True)
+        self._writer.start()
 
     def extract_domain(self, event, log_line):
         """
@@ -155,85 +302,82 @@ class LogManager:
         
         IMPORTANT: Do NOT extract arbitrary IPs from log content - only from SIP URIs.
         """
-        if not event:
+        if event is None:
             return 'unknown'
 
         try:
+            headers = event if isinstance(event, _EventHeaders) else _EventHeaders(event)
+
             # === PRIORITY 1: Use ONLY variable_domain_name (most reliable from FreeSWITCH) ===
-            try:
-                domain = event.getHeader('variable_domain_name')
-            except Exception:
-                domain = None
-            
-            if domain and isinstance(domain, str):
-                v = domain.strip()
-                if v and v.lower() != 'default':
-                    # Debug: log the extracted value
-                    logger.debug(f"Header 'variable_domain_name' = '{v}'")
-                    
-                    # Validate and sanitize domain
-                    if self._is_valid_domain(v):
-                        v = v.lower().strip()
-                        v = re.sub(r'[<>:"/\\|?*\s]', '', v)
+            # Most routed channels carry a valid one, which wins outright, so the
+            # fallback headers are then never fetched from libesl at all
+            primary = headers['variable_domain_name']
+            if primary:
+                v = self._validated_domain(primary)
+                if v and v != 'default':
+                    if _DEBUG:
                         logger.debug(f"Domain from variable_domain_name: {v}")
-                        return v or 'unknown'
+                    return v
 
-            # === FALLBACK: Try other domain headers if variable_domain_name not available ===
-            header_candidates = [
-                'Caller-Domain', 'Callee-Domain', 'User-Domain', 'Domain',
-                'domain_name', 'variable_domain', 'variable_user_domain'
-            ]
-
-            for header in header_candidates:
-                try:
-                    val = event.getHeader(header)
-                except Exception:
-                    val = None
-                
-                if not val or not isinstance(val, str):
-                    continue
-                
-                v = val.strip()
-                if not v or v.lower() == 'default':
-                    continue
+            return self._domain_from_headers(headers)
 
-                # Debug: log all extracted values
-                logger.debug(f"Fallback header '{header}' = '{v}'")
+        except Exception as e:
+            logger.exception(f"Error extracting domain: {e}")
+            return 'unknown'
 
-                # Validate and sanitize domain
-                if self._is_valid_domain(v):
-                    v = v.lower().strip()
-                    v = re.sub(r'[<>:"/\\|?*\s]', '', v)
+    def _validated_domain(self, raw):
+        """Lower-cased domain for a raw header value, or '' if it isn't valid; memoized per value"""
+        cache = self._domain_cache
+        v = cache.get(raw)
+        if v is not None:
+            cache.move_to_end(raw)
+            return v
+        # Validated domains hold only [alnum . - _], so they are already
+        # filename-safe and need no sanitizer pass
+        v = raw.strip()
+        v = v.lower() if self._is_valid_domain(v) else ''
+        cache[raw] = v
+        if len(cache) > DOMAIN_CACHE_SIZE:
+            cache.popitem(last=False)
+        return v
+
+    def _domain_from_headers(self, headers):
+        """Walk the fallback priorities, fetching each header only when it is reached"""
+        # === FALLBACK: Try other domain headers if variable_domain_name not available ===
+        for header in _DOMAIN_FALLBACK_HEADERS:
+            val = headers[header]
+            if not val:
+                continue
+
+            # Debug: log all extracted values
+            if _DEBUG:
+                logger.debug(f"Fallback header '{header}' = '{val}'")
+
+            # Validate domain (valid implies filename-safe)
+            v = self._validated_domain(val)
+            if v and v != 'default':
+                if _DEBUG:
                     logger.debug(f"Domain from fallback header '{header}': {v}")
-                    return v or 'unknown'
-
-            # === FINAL FALLBACK: Extract from Caller-ID-Number (user@domain) ===
-            try:
-                caller_id = event.getHeader('Caller-ID-Number')
-            except Exception:
-                caller_id = None
-            
-            if caller_id and isinstance(caller_id, str) and '@' in caller_id:
-                parts = caller_id.split('@', 1)
-                if len(parts) == 2:
-                    domain = parts[1].strip()
-                    if self._is_valid_domain(domain):
-                        domain = domain.lower()
-                        domain = re.sub(r'[<>:"/\\|?*\s]', '', domain)
+                return v
+
+        # === FINAL FALLBACK: Extract from Caller-ID-Number (user@domain) ===
+        caller_id = headers['Caller-ID-Number']
+        if caller_id and '@' in caller_id:
+            parts = caller_id.split('@', 1)
+            if len(parts) == 2:
+                domain = self._validated_domain(parts[1])
+                if domain:
+                    if _DEBUG:
                         logger.debug(f"Domain from Caller-ID-Number: {domain}")
-                        return domain or 'unknown'
-
-            logger.debug("No reliable domain found; using 'unknown'")
-            return 'unknown'
+                    return domain
 
-        except Exception as e:
-            logger.exception(f"Error extracting domain: {e}")
-            return 'unknown'
+        logger.debug("No reliable domain found; using 'unknown'")
+        return 'unknown'
 
     @staticmethod
     def _extract_sip_domain(sip_string):
         try:
-            match = re.search(r'sip:[\w.+-]*@([\w.-]+)', str(sip_string))
+            match = _SIP_URI_DOMAIN_RE.search(str(sip_string))
             if match:
                 return match.group(1)
         except Exception:
@@ -249,187 +393,337 @@ class LogManager:
             return True
         if len(domain) > 253:
             return False
-        labels = domain.split('.')
-        if len(labels) == 1:
-            # allow simple hostnames (alnum, - , _)
-            return all(c.isalnum() or c in '-_' for c in domain)
-        for label in labels:
-            if not label or len(label) > 63:
-                return False
-            if not all(c.isalnum() or c in '-_' for c in label):
-                return False
-        return True
+        return _VALID_DOMAIN_RE.fullmatch(domain) is not None
 
     def write_log(self, domain, log_line):
-        """Write log line to appropriate domain file - immediate write"""
+        """Queue log line for the background writer - never blocks on disk I/O"""
+        self.write_log_batch(domain, (log_line,))
+
+    def write_log_batch(self, domain, log_lines):
+        """Queue several lines for one domain under a single timestamp"""
         try:
-            with self.lock:
-                # Normalize domain: lowercase, strip, sanitize for filename
-                domain = str(domain).lower().strip() if domain else 'unknown'
-                # Remove only truly invalid filename characters: < > : " / \ | ? *
-                # Keep dots, hyphens, underscores (valid in filenames and domain/IP names)
-                domain = re.sub(r'[<>:"/\\|?*\s]', '', domain)
-                domain = domain or 'unknown'
-                
-                # use timezone-aware UTC timestamps (avoid deprecated utcnow())
-                timestamp = datetime.now(timezone.utc).astimezone().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]
+            domain = self._safe_domain(domain)
+
+            # lines of one event share its arrival time; stamp them once
+            prefix = f"[{self._timestamp()}] "
+            ring = self._ring
+            for log_line in log_lines:
                 # ensure single newline at end
                 line = log_line.rstrip('\n')
-                formatted_line = f"[{timestamp}] {line}\n"
-                # Use internal writer
-                self._write_to_file(domain, formatted_line)
+                # encode once here; the writer hands the bytes straight to writev()
+                formatted_line = f"{prefix}{line}\n".encode('utf-8', 'replace')
+                # Never stall event reception behind the disk: a full ring drops its oldest line
+                if len(ring) >= WRITE_QUEUE_SIZE:
+                    self.metrics.record_drop()
+                ring.append((domain, formatted_line))
+            if not self._wake.is_set():
+                self._wake.set()
         except Exception as e:
             logger.exception(f"Error writing log for domain={domain}: {e}")
             self.metrics.record_error()
 
+    def _safe_domain(self, domain):
+        """Filename-safe form of domain, memoized: the same few domains repeat on every event"""
+        safe = self._safe_domains.get(domain)
+        if safe is None:
+            # Normalize domain: lowercase, strip, sanitize for filename
+            safe = str(domain).lower().strip() if domain else 'unknown'
+            # Remove only truly invalid filename characters: < > : " / \ | ? *
+            # Keep dots, hyphens, underscores (valid in filenames and domain/IP names)
+            safe = _UNSAFE_FILENAME_RE.sub('', safe) or 'unknown'
+            if len(self._safe_domains) >= 1024:
+                # FIFO eviction; only the ESL thread touches this dict
+                del self._safe_domains[next(iter(self._safe_domains))]
+            self._safe_domains[domain] = safe
+        return safe
+
+    def _timestamp(self):
+        """Local time with milliseconds; the seconds prefix is formatted once per second"""
+        now = time.time()
+        sec = int(now)
+        cached_sec, prefix = self._ts_cache
+        if sec != cached_sec:
+            prefix = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(sec))
+            # single tuple store keeps (second, prefix) consistent across threads
+            self._ts_cache = (sec, prefix)
+        return f"{prefix}.{int((now - sec) * 1000):03d}"
+
+    def _writer_loop(self):
+        """Background writer: drain queued lines and write them grouped per domain"""
+        # bind per-line lookups once; this loop touches every queued line
+        ring = self._ring
+        popleft = ring.popleft
+        wake = self._wake
+        batch_size = WRITE_BATCH_SIZE
+        last_check = last_sync = time.time()
+        dirty = set()  # domains written since the last periodic sync/page-cache pass
+        settle = SYNC_ON_WRITE or (DROP_PAGE_CACHE and _FADV_DONTNEED is not None)
+        stop = False
+        while not stop:
+            if not ring:
+                wake.wait(_IDLE_WAIT)
+
+            # IMPORTANT: a file deleted on the host keeps its cached handle writable,
+            # so look for unlinked files once per flush interval rather than per write
+            now = time.time()
+            if now - last_check >= BUFFER_FLUSH_INTERVAL:
+                last_check = now
+                try:
+                    with self.lock:
+                        self._drop_unlinked_handles()
+                except Exception as e:
+                    logger.exception(f"Error checking log handles: {e}")
+                # the periodic flush rides this tick, keeping timers out of the recv loop
+                self.flush_buffers()
+            # clear before draining so an append racing with the drain re-arms the event
+            wake.clear()
+
+            batch = defaultdict(list)
+            count = 0
+            while count < batch_size:
+                try:
+                    item = popleft()
+                except IndexError:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                domain, line = item
+                batch[domain].append(line)
+                count += 1
+
+            if batch:
+                try:
+                    with self.lock:
+                        for domain, chunks in batch.items():
+                            self._write_to_file(domain, chunks)
+                except Exception as e:
+                    logger.exception(f"Error in log writer: {e}")
+                    self.metrics.record_error()
+                if settle:
+                    dirty.update(batch)
+
+            # SYNC_ON_WRITE bounds data loss to one flush interval: a single group
+            # fdatasync per interval (and on shutdown) instead of one per batch
+            if dirty and (stop or now - last_sync >= BUFFER_FLUSH_INTERVAL):
+                last_sync = now
+                try:
+                    with self.lock:
+                        if SYNC_ON_WRITE:
+                            self._sync_domains(dirty)
+                        if DROP_PAGE_CACHE:
+                            self._drop_page_cache(dirty)
+                except Exception as e:
+                    logger.exception(f"Error syncing log files: {e}")
+                dirty.clear()
+
     def flush_buffers(self):
+        # Domain files are unbuffered and only the writer thread writes them, so the
+        # periodic tick has nothing to push to disk and need not contend for the lock
         try:
-            with self.lock:
-                flushed_entries = 0
-                for domain, entries in list(self.buffers.items()):
-                    if not entries:
-                        continue
-                    content = ''.join(entries)
-                    self._write_to_file(domain, content)
-                    flushed_entries += len(entries)
-                    entries.clear()
-                if flushed_entries:
-                    logger.debug(f"Flushed {flushed_entries} buffered log entries to disk")
-                self.metrics.record_domain(len(self.file_handles))
+            self.metrics.record_domain(len(self.files))
         except Exception as e:
             logger.exception(f"Error flushing buffers: {e}")
             self.metrics.record_error()
 
-    def _write_to_file(self, domain, content):
-        # Normalize domain: lowercase, strip, sanitize for filename
-        domain = str(domain).lower().strip() if domain else 'unknown'
-        # Remove only truly invalid filename characters: < > : " / \ | ? *
-        # Keep dots, hyphens, underscores (valid in filenames and domain/IP names)
-        domain = re.sub(r'[<>:"/\\|?*\s]', '', domain)
-        domain = domain or 'unknown'
-        
-        log_file = self.log_dir / f"{domain}.log"
+    def _sync_domains(self, domains):
+        """fdatasync the given domains' handles together rather than one file after another"""
+        fds = []
+        for domain in domains:
+            df = self.files.get(domain)
+            if df is not None and not df.handle.closed:
+                fds.append(df.handle.fileno())
+        if len(fds) == 1:
+            _datasync(fds[0])
+        elif fds:
+            # wait for all of them before the writer touches the handles again
+            list(self._sync_pool.map(_datasync, fds))
+
+    def _drop_page_cache(self, domains):
+        """Advise DONTNEED on written log files: clean pages are dropped, dirty ones queued for writeback"""
+        if _FADV_DONTNEED is None:
+            return
+        for domain in domains:
+            df = self.files.get(domain)
+            if df is None or df.handle.closed:
+                continue
+            try:
+                os.posix_fadvise(df.handle.fileno(), 0, 0, _FADV_DONTNEED)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _write_chunks(f, chunks):
+        """Gather-write byte chunks to an unbuffered file, one writev() per IOV_MAX chunks"""
+        fd = f.fileno()
+        if not hasattr(os, 'writev'):
+            data = memoryview(b''.join(chunks))
+            while data:
+                data = data[os.write(fd, data):]
+            return
+        for i in range(0, len(chunks), _IOV_MAX):
+            group = chunks[i:i + _IOV_MAX]
+            written = os.writev(fd, group)
+            total = sum(map(len, group))
+            if written < total:
+                # short write (rare on regular files) - finish the remainder
+                rest = memoryview(b''.join(group))[written:]
+                while rest:
+                    rest = rest[os.write(fd, rest):]
+
+    def _open_file(self, domain):
+        """Open domain's log file for appending and size it once from fstat()"""
+        # Enforce file descriptor limit
+        if len(self.files) >= MAX_FILE_DESCRIPTORS:
+            self._close_oldest_file()
+
+        # Built once per open; the _DomainFile keeps it for the life of the handle
+        log_file = os.path.join(self._log_dir_str, f"{domain}.log")
+        # Ensure parent exists
         try:
-            # Rotate if needed
-            if log_file.exists():
-                try:
-                    current_size = log_file.stat().st_size
-                except OSError:
-                    current_size = self.file_sizes.get(domain, 0)
-                if current_size + len(content.encode('utf-8')) >= self.rotation_size:
-                    self._rotate_log(domain, log_file)
-
-            # Enforce file descriptor limit
-            if len(self.file_handles) >= MAX_FILE_DESCRIPTORS and domain not in self.file_handles:
-                self._close_oldest_file()
-
-            # Open file if necessary
-            # IMPORTANT: Check if file handle exists AND the underlying file still exists
-            # If file was deleted on host but handle is still cached, close and reopen
-            needs_open = domain not in self.file_handles
-            if not needs_open:
-                handle = self.file_handles[domain]
-                # If handle is closed or file no longer exists on disk, mark for re-opening
-                if handle.closed or not log_file.exists():
-                    try:
-                        handle.close()
-                    except Exception:
-                        pass
-                    del self.file_handles[domain]
-                    needs_open = True
+            self.log_dir.mkdir(parents=True, exist_ok=True)
+        except Exception:
+            pass
+        # Unbuffered binary append: batching already happens in the writer thread,
+        # and writev() must not be mixed with a userspace buffer
+        f = open(log_file, 'ab', buffering=0)
+        # Seed the in-memory size once; afterwards it is maintained per write
+        try:
+            size = os.fstat(f.fileno()).st_size
+        except OSError:
+            size = 0
+        df = self.files[domain] = _DomainFile(f, log_file, size)
+        return df
+
+    def _close_file(self, domain):
+        df = self.files.pop(domain, None)
+        if df is not None:
+            try:
+                df.handle.close()
+            except Exception:
+                pass
 
-            if needs_open:
-                # Ensure parent exists
-                try:
-                    self.log_dir.mkdir(parents=True, exist_ok=True)
-                except Exception:
-                    pass
-                f = open(log_file, 'a', encoding='utf-8', buffering=8192)
-                self.file_handles[domain] = f
-                # initialize size if unknown
-                try:
-                    self.file_sizes[domain] = log_file.stat().st_size
-                except Exception:
-                    self.file_sizes[domain] = 0
+    def _drop_unlinked_handles(self):
+        """Close cached handles whose file was deleted or moved on the host so the next write recreates it"""
+        for domain, df in list(self.files.items()):
+            try:
+                if df.handle.closed:
+                    unlinked = True
+                else:
+                    # a rename (logrotate without copytruncate, mv) leaves st_nlink at 1,
+                    # so compare the inode behind the path with the one we hold open
+                    held = os.fstat(df.handle.fileno())
+                    current = os.stat(df.path)
+                    unlinked = (current.st_ino, current.st_dev) != (held.st_ino, held.st_dev)
+            except OSError:
+                # FileNotFoundError included: nothing at the path any more
+                unlinked = True
+            if unlinked:
+                self._close_file(domain)
+                logger.debug(f"Log file for {domain} vanished; will reopen on next write")
+
+    def _write_to_file(self, domain, chunks):
+        # domain comes off the ring, already normalized by write_log_batch()
+        df = self.files.get(domain)
+        try:
+            bytes_written = sum(map(len, chunks))
+            if df is None or df.handle.closed:
+                self._close_file(domain)
+                df = self._open_file(domain)
+            else:
+                self.files.move_to_end(domain)
 
-            f = self.file_handles[domain]
-            f.write(content)
-            f.flush()
-            if SYNC_ON_WRITE:
-                try:
-                    os.fsync(f.fileno())
-                except Exception:
-                    pass
+            # Rotate if needed - size is tracked in memory, seeded by fstat() on open
+            if df.size and df.size + bytes_written >= self.rotation_size:
+                self._rotate_log(domain, df.path)
+                df = self._open_file(domain)
 
-            bytes_written = len(content.encode('utf-8'))
-            self.file_sizes[domain] = self.file_sizes.get(domain, 0) + bytes_written
-            self.file_access[domain] = time.time()
-            self.metrics.record_write(bytes_written)
-            logger.debug(f"Wrote {bytes_written} bytes to {log_file} (total: {self.file_sizes[domain]})")
+            self._write_chunks(df.handle, chunks)
+
+            df.size += bytes_written
+            self.metrics.record_write(bytes_written, len(chunks))
+            if _DEBUG:
+                logger.debug(f"Wrote {bytes_written} bytes to {df.path} (total: {df.size})")
 
         except Exception as e:
-            logger.exception(f"Error writing to {log_file}: {e}")
             self.metrics.record_error()
+            # A full disk fails every write; summarize at most once a second
+            # instead of letting a traceback per line become the bottleneck
+            self._write_errors += 1
+            now = time.time()
+            if now - self._last_write_error_log >= 1.0:
+                # df is None only when opening failed before any handle existed
+                log_file = df.path if df is not None else os.path.join(self._log_dir_str, f"{domain}.log")
+                logger.exception(f"Error writing to {log_file} ({self._write_errors} write errors since last report): {e}")
+                self._last_write_error_log = now
+                self._write_errors = 0
             # Clean up a broken handle
-            if domain in self.file_handles:
-                try:
-                    self.file_handles[domain].close()
-                except Exception:
-                    pass
-                del self.file_handles[domain]
+            self._close_file(domain)
 
     def _rotate_log(self, domain, log_file):
         try:
-            if domain in self.file_handles and not self.file_handles[domain].closed:
-                try:
-                    self.file_handles[domain].close()
-                except Exception:
-                    pass
-                del self.file_handles[domain]
+            df = self.files.pop(domain, None)
+            if df is not None:
+                # renaming an open file is fine on POSIX, so the handle may be
+                # retired in the background while the new file opens right away
+                self._retire(df.handle)
 
             # rotation timestamp - timezone-aware
             timestamp = datetime.now(timezone.utc).astimezone().strftime('%Y%m%d_%H%M%S')
-            rotated_file = self.log_dir / f"{domain}_{timestamp}.log"
+            rotated_file = os.path.join(self._log_dir_str, f"{domain}_{timestamp}.log")
             try:
-                log_file.rename(rotated_file)
+                os.rename(log_file, rotated_file)
                 logger.info(f"Rotated log file: {log_file} -> {rotated_file}")
             except Exception as e:
                 logger.warning(f"Failed to rotate file {log_file}: {e}")
-
-            self.file_sizes[domain] = 0
         except Exception as e:
             logger.exception(f"Error rotating log file {log_file}: {e}")
             self.metrics.record_error()
 
     def _close_oldest_file(self):
         try:
-            if not self.file_handles:
+            if not self.files:
                 return
-            oldest_domain = min(self.file_access.keys(), key=lambda d: self.file_access.get(d, 0))
-            handle = self.file_handles.get(oldest_domain)
-            if handle and not handle.closed:
-                try:
-                    handle.close()
-                except Exception:
-                    pass
-            self.file_handles.pop(oldest_domain, None)
-            self.file_access.pop(oldest_domain, None)
+            # files is kept in write order, so the front is the least recently used
+            oldest_domain, df = self.files.popitem(last=False)
+            self._retire(df.handle)
             logger.debug(f"Closed oldest file handle for domain: {oldest_domain}")
         except Exception as e:
             logger.exception(f"Error closing oldest file: {e}")
 
+    def _retire(self, handle):
+        """Close a handle leaving the cache; under SYNC_ON_WRITE it is synced first, off the writer"""
+        if handle.closed:
+            return
+        if self._sync_pool is not None:
+            # the periodic group sync only reaches cached handles, so settle this one
+            # on the pool; close_all() waits for the pool before returning
+            self._sync_pool.submit(_sync_and_close, handle)
+            return
+        try:
+            handle.close()
+        except Exception:
+            pass
+
     def close_all(self):
         self.running = False
+        # Let the writer drain whatever is still queued before closing handles
+        if len(self._ring) >= WRITE_QUEUE_SIZE:
+            self.metrics.record_drop()
+        self._ring.append(_STOP)
+        self._wake.set()
+        self._writer.join(timeout=10)
+        if self._sync_pool is not None:
+            self._sync_pool.shutdown(wait=True)
         self.flush_buffers()
         with self.lock:
-            for domain, handle in list(self.file_handles.items()):
+            for domain, df in list(self.files.items()):
                 try:
-                    if handle and not handle.closed:
-                        handle.close()
+                    if not df.handle.closed:
+                        df.handle.close()
                 except Exception as e:
                     logger.exception(f"Error closing handle for {domain}: {e}")
-            self.file_handles.clear()
-            self.file_access.clear()
+            self.files.clear()
         logger.info("All log files closed")
 
 
@@ -441,28 +735,34 @@ class FreeSwitchLogCollector:
         self.connection = None
         self.log_manager = LogManager(LOG_DIR, FILE_ROTATION_SIZE, self.metrics)
         self.running = False
-        self.last_flush = time.time()
         self.connection_attempts = 0
         self.max_connection_attempts = 5
-        self.recent_event_ids = deque(maxlen=10000)
+        # insertion-ordered set of recent dedupe keys: O(1) lookup, oldest evicted first
+        self.recent_event_ids = OrderedDict()
+        self._recent_max = 10000
+        # run() waits on the ESL socket plus a self-pipe that signal handlers write to
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_r, False)
+        os.set_blocking(self._wakeup_w, False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+        self._esl_fd = None
+        self._esl_pending = False
 
     def connect(self):
         try:
             logger.info(f"Attempting connection to FreeSWITCH at {ESL_HOST}:{ESL_PORT}")
             logger.info(f"Attempt {self.connection_attempts + 1}/{self.max_connection_attempts}")
 
-            import socket
+            # IMPORTANT: ESLconnection connects with no timeout, so a blackholed host would
+            # hold this thread (and a pending SIGTERM) through the kernel's SYN retries.
+            # Bound reachability to 5s with a throwaway connection first.
             try:
-                sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                sock.settimeout(5)
-                result = sock.connect_ex((ESL_HOST, ESL_PORT))
-                sock.close()
-                if result != 0:
-                    logger.error(f"TCP port {ESL_PORT} on {ESL_HOST} is not reachable (errno: {result})")
-                    self.connection_attempts += 1
-                    return False
-            except Exception as e:
-                logger.warning(f"Connectivity check exception: {e}")
+                socket.create_connection((ESL_HOST, ESL_PORT), timeout=5).close()
+            except OSError as e:
+                logger.error(f"TCP port {ESL_PORT} on {ESL_HOST} is not reachable: {e}")
+                self.connection_attempts += 1
+                return False
 
             self.connection = ESL.ESLconnection(ESL_HOST, str(ESL_PORT), ESL_PASSWORD)
             # Some bindings call connected(), some call is_connected(); try both
@@ -480,19 +780,20 @@ class FreeSwitchLogCollector:
     
                 # Use raw log subscription to capture fs_cli-style output (file:line, severity)
                 try:
-                    self.connection.events("log", "all")
-                    logger.info("✓ Subscribed to all RAW log events (log/all)")
+                    self.connection.events("log", ESL_SUBSCRIBED_EVENTS)
+                    logger.info(f"✓ Subscribed to RAW log events (log/{ESL_SUBSCRIBED_EVENTS})")
                 except Exception:
                     # Fallback to plain events if 'log' isn't supported
                     try:
-                        self.connection.events("plain", "all")
-                        logger.info("✓ Subscribed to parsed events (plain/all) - raw logs unavailable")
+                        self.connection.events("plain", ESL_SUBSCRIBED_EVENTS)
+                        logger.info(f"✓ Subscribed to parsed events (plain/{ESL_SUBSCRIBED_EVENTS}) - raw logs unavailable")
                     except Exception:
                         logger.warning("Failed to subscribe to events via ESL API")
                 self.connection_attempts = 0
+                self._watch_connection()
                 return True
             else:
-                logger.error('Failed to establish ESL connection')
+                logger.error(f"Failed to establish ESL connection to {ESL_HOST}:{ESL_PORT}")
                 self.connection_attempts += 1
                 return False
         except Exception as e:
@@ -500,107 +801,235 @@ class FreeSwitchLogCollector:
             self.connection_attempts += 1
             return False
 
+    def _watch_connection(self):
+        """Register the current ESL socket with the selector (replacing any previous one)"""
+        if self._esl_fd is not None:
+            try:
+                self._selector.unregister(self._esl_fd)
+            except (KeyError, ValueError, OSError):
+                pass
+            self._esl_fd = None
+        self._esl_pending = False
+
+        try:
+            fd = self.connection.socketDescriptor()
+        except Exception:
+            fd = -1
+        if fd is None or fd < 0:
+            logger.debug("ESL socket descriptor unavailable; falling back to recvEventTimed polling")
+            return
+        self._tune_socket(fd)
+        try:
+            # The socket stays blocking: libesl polls it itself before each recv()
+            self._selector.register(fd, selectors.EVENT_READ)
+            self._esl_fd = fd
+            # Events that arrived before a command reply (e.g. the subscription's) are
+            # parked inside libesl where select() can't see them; drain before first select
+            self._esl_pending = True
+        except Exception as e:
+            logger.debug(f"Could not watch ESL socket {fd}: {e}")
+
+    @staticmethod
+    def _tune_socket(fd):
+        """Enlarge the ESL socket receive buffer so event bursts don't stall TCP"""
+        # An explicit SO_RCVBUF is capped by net.core.rmem_max and switches off TCP
+        # receive autotuning (which can grow to the tcp_rmem max), so it is opt-in
+        if ESL_RCVBUF <= 0:
+            return
+        try:
+            # fromfd() dups the descriptor, so closing the wrapper leaves libesl's fd open
+            sock = socket.fromfd(fd, socket.AF_INET, socket.SOCK_STREAM)
+        except OSError as e:
+            logger.debug(f"Could not wrap ESL socket {fd}: {e}")
+            return
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, ESL_RCVBUF)
+            effective = sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+            # Linux reports double the requested size when it is granted in full
+            if effective < ESL_RCVBUF:
+                logger.warning(f"ESL SO_RCVBUF is {effective} bytes (requested {ESL_RCVBUF}); "
+                               f"raise net.core.rmem_max to allow more")
+            else:
+                logger.debug(f"ESL SO_RCVBUF set to {effective} bytes")
+        except OSError as e:
+            logger.debug(f"Could not set SO_RCVBUF on ESL socket: {e}")
+        finally:
+            sock.close()
+
+    def wakeup(self):
+        """Interrupt a pending select() in run(); safe to call from a signal handler"""
+        try:
+            os.write(self._wakeup_w, b'\0')
+        except (BlockingIOError, OSError):
+            pass
+
+    def _pause(self, seconds):
+        """time.sleep() that a wakeup() cuts short, so a signal never waits out a reconnect delay"""
+        if not self.running:
+            return
+        try:
+            select.select([self._wakeup_r], [], [], seconds)
+        except (OSError, ValueError):
+            time.sleep(seconds)
+        self._drain_wakeups()
+
+    def _drain_wakeups(self):
+        try:
+            while os.read(self._wakeup_r, 512):
+                pass
+        except (BlockingIOError, OSError):
+            pass
+
+    def _receive_events(self):
+        """Wait for ESL data (or a wakeup), then drain a batch"""
+        if self._esl_fd is None:
+            # No socket to watch - let libesl do the waiting
+            event = self.connection.recvEventTimed(1000)
+            if not event:
+                return
+            self.process_event(event)
+        else:
+            if self._esl_pending:
+                timeout = 0
+            else:
+                # flushing is the writer's job; the timeout only re-checks the connection
+                timeout = _IDLE_WAIT
+            readable = False
+            for key, _ in self._selector.select(timeout):
+                if key.fd == self._wakeup_r:
+                    self._drain_wakeups()
+                else:
+                    readable = True
+            if not readable and not self._esl_pending:
+                return
+
+        # Drain whatever is already queued before going back to the timers.
+        # NOTE: recvEventTimed(0) means "block forever" in libesl, so use 1ms.
+        self._esl_pending = False
+        for _ in range(RECV_BATCH_SIZE):
+            event = self.connection.recvEventTimed(1)
+            if not event:
+                break
+            self.process_event(event)
+        else:
+            # Batch cap hit: libesl may still hold parsed events the socket won't signal
+            self._esl_pending = True
+
     def process_event(self, event):
         try:
-            event_id = None
-            try:
-                en = event.getHeader('Event-Name') or ''
-                uid = event.getHeader('Unique-ID') or event.getHeader('Event-UUID') or ''
-                event_id = f"{en}|{uid}"
-            except Exception:
-                event_id = None
+            # process_event and extract_domain read overlapping headers; share one memo
+            headers = _EventHeaders(event)
+            en = headers['Event-Name'] or ''
+            # names are matched case-insensitively, as they always have been
+            event_name = en.upper()
+            if event_name == 'HEARTBEAT':
+                # nothing is written for heartbeats: count them, but skip the dedupe
+                # header fetches and keep their unique UUIDs out of recent_event_ids
+                self.metrics.record_event()
+                return
+            uid = headers['Unique-ID'] or headers['Event-UUID'] or ''
+            event_id = f"{en}|{uid}"
 
             if event_id and event_id in self.recent_event_ids:
-                logger.debug(f"Duplicate event ignored: {event_id}")
+                if _DEBUG:
+                    logger.debug(f"Duplicate event ignored: {event_id}")
                 return
             if event_id:
-                self.recent_event_ids.append(event_id)
+                recent = self.recent_event_ids
+                recent[event_id] = None
+                if len(recent) > self._recent_max:
+                    recent.popitem(last=False)
 
             self.metrics.record_event()
-            event_name = event.getHeader('Event-Name') or ''
-
-            log_data = None
-            if event_name.upper() in ('LOG', 'CHANNEL_LOG'):
-                try:
-                    body = event.getBody() or ''
-                except Exception:
-                    body = ''
-
-                # Prefer raw LOG format with severity and file:line when available
-                log_level = None
-                try:
-                    log_level = event.getHeader('Log-Level') or event.getHeader('Severity')
-                except Exception:
-                    log_level = None
-                if not log_level:
-                    log_level = 'INFO'
-
-                file_info = ''
-                try:
-                    f = event.getHeader('File') or ''
-                    l = event.getHeader('Line') or ''
-                    if f or l:
-                        file_info = f"[{f}:{l}] " if f and l else f"[{f or l}] "
-                except Exception:
-                    file_info = ''
-
-                formatted = f"[{log_level}] {file_info}{body}".strip()
-                log_data = formatted
 
-                # Also emit raw log to stdout so container logs mirror fs_cli
-                try:
-                    logger.info(formatted)
-                except Exception:
-                    logger.debug(formatted)
-            elif event_name and event_name.upper() != 'HEARTBEAT':
-                # Build a rich log line containing headers and body so files contain full call info
-                priority = event.getHeader('Log-Level') or event.getHeader('Severity') or 'INFO'
-                try:
-                    body = event.getBody() or ''
-                except Exception:
-                    body = ''
-
-                headers_of_interest = [
-                    'Unique-ID', 'Channel-Name', 'Caller-ID-Number', 'Caller-ID-Name',
-                    'Destination-Number', 'Caller-Domain', 'Callee-Domain', 'Channel-State',
-                    'Call-Direction', 'Application', 'Application-Data',
-                    'Presence-ID', 'Sofia-User-Agent', 'Signaling-IP', 'Signaling-Port',
-                    'Media-IP', 'Media-Port', 'Session-ID'
-                ]
-                header_parts = []
-                for h in headers_of_interest:
-                    try:
-                        val = event.getHeader(h)
-                    except Exception:
-                        val = None
-                    if val:
-                        header_parts.append(f"{h}={val}")
-
-                header_str = ' '.join(header_parts)
-                # include any body payload after headers
-                combined = f"{header_str} {body}".strip()
-                log_data = f"[{event_name}] [{priority}] {combined}".strip()
-                # Also log the rich line to stdout for visibility
-                try:
-                    logger.info(log_data)
-                except Exception:
-                    logger.debug(log_data)
+            # one dict lookup picks the formatter; nameless events map to None
+            formatter = self._EVENT_FORMATTERS.get(event_name, FreeSwitchLogCollector._format_rich_event)
+            log_lines = formatter(self, event, headers) if formatter else None
 
-            if log_data:
-                domain = self.log_manager.extract_domain(event, log_data)
+            if log_lines:
+                if event_name in _DOMAINLESS_EVENTS:
+                    domain = 'unknown'
+                else:
+                    domain = self.log_manager.extract_domain(headers, log_lines[0])
                 
                 # Primary: write to domain-specific log (organized by domain only)
-                self.log_manager.write_log(domain, log_data)
+                self.log_manager.write_log_batch(domain, log_lines)
                 
-                # Always persist a full fs_cli-style stream for complete raw logs
-                try:
-                    self.log_manager.write_log('fs_cli', log_data)
-                except Exception:
-                    pass
+                # Persist a full fs_cli-style stream for complete raw logs unless disabled
+                if ENABLE_FS_CLI_MIRROR:
+                    try:
+                        self.log_manager.write_log_batch('fs_cli', log_lines)
+                    except Exception:
+                        pass
         except Exception as e:
             logger.exception(f"Error processing event: {e}")
             self.metrics.record_error()
 
+    def _format_log_event(self, event, headers):
+        """LOG/CHANNEL_LOG: one line per body line, in raw fs_cli form"""
+        try:
+            body = event.getBody() or ''
+        except Exception:
+            body = ''
+
+        # Prefer raw LOG format with severity and file:line when available
+        log_level = headers['Log-Level'] or headers['Severity'] or 'INFO'
+
+        file_info = ''
+        f = headers['File'] or ''
+        l = headers['Line'] or ''
+        if f or l:
+            file_info = f"[{f}:{l}] " if f and l else f"[{f or l}] "
+
+        # One file line per body line, each keeping the severity/file prefix,
+        # so multi-line payloads (SDP, stack dumps) stay greppable line by line.
+        # Blank lines are kept: they separate SIP headers from bodies in trace dumps
+        prefix = f"[{log_level}] {file_info}"
+        log_lines = [f"{prefix}{ln}".strip() for ln in body.splitlines()]
+        if not log_lines:
+            log_lines = [prefix.strip()]
+        formatted = '\n'.join(log_lines)
+
+        # Also emit raw log to stdout so container logs mirror fs_cli
+        try:
+            logger.info(formatted)
+        except Exception:
+            logger.debug(formatted)
+        return log_lines
+
+    def _format_rich_event(self, event, headers):
+        """Any other event: a rich line containing headers and body so files contain full call info"""
+        event_name = headers['Event-Name']
+        priority = headers['Log-Level'] or headers['Severity'] or 'INFO'
+        try:
+            body = event.getBody() or ''
+        except Exception:
+            body = ''
+
+        header_parts = []
+        for h in _RICH_EVENT_HEADERS:
+            val = headers[h]
+            if val:
+                header_parts.append(f"{h}={val}")
+
+        header_str = ' '.join(header_parts)
+        # include any body payload after headers
+        combined = f"{header_str} {body}".strip()
+        log_data = f"[{event_name}] [{priority}] {combined}".strip()
+        # Also log the rich line to stdout for visibility
+        try:
+            logger.info(log_data)
+        except Exception:
+            logger.debug(log_data)
+        return (log_data,)
+
+    # Event-Name -> formatter returning the lines to write; unlisted names get the rich line
+    _EVENT_FORMATTERS = {
+        'LOG': _format_log_event,
+        'CHANNEL_LOG': _format_log_event,
+        '': None,
+    }
+
     def _metrics_worker(self):
         # background thread to emit metrics periodically
         while self.running:
@@ -623,30 +1052,22 @@ class FreeSwitchLogCollector:
                 if not self.connection or not getattr(self.connection, 'connected', lambda: False)():
                     if self.connection_attempts >= self.max_connection_attempts:
                         logger.error(f"Failed to connect after {self.max_connection_attempts} attempts; sleeping 30s")
-                        time.sleep(30)
+                        self._pause(30)
                         self.connection_attempts = 0
                         continue
 
                     logger.warning('Connection lost or not established, attempting to reconnect...')
                     if not self.connect():
                         logger.error(f"Reconnection failed, retrying in {RECONNECT_DELAY}s")
-                        time.sleep(RECONNECT_DELAY)
+                        self._pause(RECONNECT_DELAY)
                         continue
 
                 # recvEventTimed may raise or return None
                 try:
-                    event = self.connection.recvEventTimed(1000)
-                    if event:
-                        self.process_event(event)
+                    self._receive_events()
                 except Exception as e:
                     logger.debug(f"recvEventTimed/recv error: {e}")
 
-                # periodic flush
-                current_time = time.time()
-                if current_time - self.last_flush >= BUFFER_FLUSH_INTERVAL:
-                    self.log_manager.flush_buffers()
-                    self.last_flush = current_time
-
             except KeyboardInterrupt:
                 logger.info('KeyboardInterrupt received')
                 break
@@ -655,6 +1076,7 @@ class FreeSwitchLogCollector:
                 self.metrics.record_error()
                 time.sleep(1)
 
+        logger.info('Main loop stopped')
         self.shutdown()
 
     def shutdown(self):
@@ -685,15 +1107,11 @@ COLLECTOR = None
 
 
 def _signal_handler(signum, frame):
-    logger.info(f"Received signal {signum}; initiating shutdown")
-    try:
-        if COLLECTOR:
-            COLLECTOR.shutdown()
-    except Exception:
-        pass
-    # wait a short moment then exit
-    time.sleep(0.3)
-    sys.exit(0)
+    # Only flag and wake the main loop: run() notices, leaves its loop and calls
+    # shutdown() itself, outside signal context and with no locks held here
+    if COLLECTOR:
+        COLLECTOR.running = False
+        COLLECTOR.wakeup()
 
 
 def main():